@@ -14,25 +14,53 @@
 #    convention=numpy
 
 import argparse
+import base64
+import bisect
+import collections
+import concurrent.futures
 import datetime
+import gzip
+import hashlib
+import json
 import logging
+import math
+import queue
 import random
 import signal
 import sqlite3
 import sys
+import threading
 import time
+import urllib.parse
 import urllib.request
+import zipfile
+import zlib
+from array import array
 from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from locale import LC_MONETARY, LC_NUMERIC, atof, setlocale
 
 import bs4 as bs
 import matplotlib.pyplot as plot
 import pyperclip
 from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QFont
 # Imports, sorted by isort
 from PyQt5.QtWidgets import QApplication, QMainWindow
 
+# Optional imports, only needed for columnar export/import
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
 setlocale(LC_NUMERIC, '')  # set to your default locale
 setlocale(LC_MONETARY, '')  # set to your default locale
 
@@ -42,6 +70,46 @@ MAX_PRODUCT_NAME_LENGTH = 30  # max length for display
 # HTTP error code 429 ... Too Many Requests
 # ERROR_MSG_429 = "Too many requests, try again in 15 mins"
 ERROR_MSG_429 = "Price unavailable."
+# rows per chunk when streaming history to/from columnar files
+EXPORT_CHUNK_SIZE = 65536
+# seconds a connection waits for a lock before "database is locked"
+DB_BUSY_TIMEOUT = 30
+# maximum number of queued writes committed in one transaction
+WRITE_BATCH_SIZE = 256
+# HTTP API: worker threads (each with its own connection), history points
+API_THREADS = 4
+API_HISTORY_POINTS = 200
+API_MAX_HISTORY_POINTS = 5000
+API_CACHE_SIZE = 256  # cached responses, least recently used evicted
+# refresh scheduling: default scrape budget, check interval bounds (seconds)
+REFRESH_BUDGET_PER_DAY = 200
+MIN_REFRESH_INTERVAL = 15 * 60
+MAX_REFRESH_INTERVAL = 14 * 24 * 60 * 60
+# prior for the change rate of a product: PRIOR_CHANGES changes seen
+# in PRIOR_SECONDS, i.e. about one change a week for unknown products
+PRIOR_CHANGES = 1.0
+PRIOR_SECONDS = 7 * 24 * 60 * 60
+SECONDS_PER_DAY = 24 * 60 * 60
+# memory budget of the in-process price history cache, in bytes
+HISTORY_CACHE_BYTES = 64 * 1024 * 1024
+# milliseconds between two polls of the GUI for new rows in the database
+LABEL_REFRESH_INTERVAL_MS = 2000
+# amazon with delta and changed computed on the fly, queried instead of
+# amazon when a database from before these columns is opened read-only,
+# and used by update_deltas; {where} restricts the rows, e.g. to URLs
+DELTAS_FROM_HISTORY_WHERE = (
+    "(SELECT amazon.id AS id, url, price, datestamp, unix, "
+    "previous.delta AS delta, COALESCE(previous.delta != 0, 0) AS changed "
+    "FROM amazon LEFT JOIN (SELECT id, price - LAG(price) OVER "
+    "(PARTITION BY url ORDER BY unix, id) AS delta FROM amazon "
+    "WHERE typeof(price) IN ('integer', 'real') AND price >= 0 "
+    "AND {where}) AS previous ON amazon.id = previous.id WHERE {where})"
+)
+DELTAS_FROM_HISTORY = DELTAS_FROM_HISTORY_WHERE.format(where="1")
+# seconds before a live fetch gives up
+FETCH_TIMEOUT = 30
+# bytes read at a time while indexing a replay archive
+REPLAY_READ_SIZE = 65536
 
 # Global Variables
 # avoid them if possible
@@ -58,70 +126,349 @@ class ProductDatabase:
 
     # class variables here, use only when required
 
-    def __init__(self, args: argparse.Namespace, db_file_path: str):
+    def __init__(
+        self,
+        args: argparse.Namespace,
+        db_file_path: str,
+        read_only: bool = False,
+    ):
         """Initialize the class methods and instance variables.
 
+        Reads use one read-only connection per thread. All writes are
+        queued to a single writer thread owning the only writable
+        connection, which commits queued writes in batches. The object
+        can therefore be shared by any number of threads.
+
         Arguments:
         ---------
             args: argparse.Namespace -- arguments from argparse
             db_file_path: str -- path and name of sqlite3 database file
+            read_only: bool -- open the database read-only, e.g. for the API
 
         """
-        self.connection = sqlite3.connect(db_file_path)
-        self.cursor = self.connection.cursor()  # sqlite3.Cursor
-        self.create_table()
+        self.db_file_path = db_file_path
+        self.read_only = read_only
+        self.local = threading.local()  # per-thread reader connection
+        self.readers = []  # all reader connections, closed by close()
+        self.readers_lock = threading.Lock()
+        self.write_queue = queue.Queue()
+        self.write_lock = threading.Lock()  # queueing vs stopping the writer
+        self.writer = None
+        self.history = PriceHistoryCache(self, HISTORY_CACHE_BYTES)
+        if not read_only:
+            self.writer = threading.Thread(
+                target=self.writer_loop,
+                args=(
+                    sqlite3.connect(
+                        db_file_path,
+                        timeout=DB_BUSY_TIMEOUT,
+                        check_same_thread=False,
+                    ),
+                ),
+                name="ProductDatabase-writer",
+                daemon=True,
+            )
+            self.writer.start()
+            try:
+                self.create_table()
+            except Exception:
+                self.stop_writer()
+                raise
+        self.inspect_schema()
         logging.debug(f"init:: rows in db: {self.get_row_count()}")
         logging.debug(f"init:: db rows: {self.get_all_rows()}")
 
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Get the read-only connection of the calling thread."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # check_same_thread is off only so that close() can close it
+            connection = sqlite3.connect(
+                f"file:{urllib.parse.quote(self.db_file_path)}?mode=ro",
+                uri=True,
+                timeout=DB_BUSY_TIMEOUT,
+                check_same_thread=False,
+            )
+            self.local.connection = connection
+            self.local.cursor = connection.cursor()
+            with self.readers_lock:
+                self.readers.append(connection)
+        return connection
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """Get the read-only cursor of the calling thread."""
+        self.connection  # make sure this thread has a connection
+        return self.local.cursor
+
+    def writer_loop(self, connection: sqlite3.Connection):
+        """Execute queued writes in batches, one transaction per batch.
+
+        Runs in the writer thread until None is queued. If the database
+        cannot be set up, every queued write fails with that error.
+
+        Arguments:
+        ---------
+            connection: sqlite3.Connection -- the only writable connection
+
+        """
+        try:
+            # WAL lets readers go on while the writer commits
+            connection.execute("PRAGMA journal_mode=WAL")
+            setup_error = None
+        except sqlite3.Error as e:  # e.g. locked for longer than the timeout
+            logging.error(f"writer_loop:: cannot set up the database: {e}")
+            setup_error = e
+        running = True
+        while running:
+            batch = [self.write_queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:  # close() was called, write the rest and stop
+                batch = [item for item in batch if item is not None]
+                running = False
+            if batch and setup_error is not None:
+                for *_, future in batch:
+                    future.set_exception(setup_error)
+            elif batch:
+                try:
+                    self.write_batch(connection, batch)
+                except Exception as e:  # never let the writer thread die
+                    logging.error(f"writer_loop:: batch not written: {e}")
+                    for *_, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+        # writes queued after None, if any, would wait forever
+        while True:
+            try:
+                item = self.write_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[-1].set_exception(
+                    sqlite3.OperationalError("database writer is not running")
+                )
+        try:
+            # move everything from the -wal file into the database file
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            logging.error(f"writer_loop:: checkpoint failed: {e}")
+        connection.close()
+
+    def write_batch(self, connection: sqlite3.Connection, batch: list):
+        """Write a batch of (sql, params, many, future) in one transaction.
+
+        If the transaction fails, every write is retried on its own so that
+        one bad write only fails its own future.
+
+        """
+        try:
+            with connection:  # commits, or rolls back on exception
+                # explicitly, as sqlite3 would not begin before DDL
+                connection.execute("BEGIN")
+                results = [
+                    execute_write(connection, sql, params, many)
+                    for sql, params, many, _ in batch
+                ]
+        except Exception as e:  # e.g. OverflowError for too large integers
+            logging.debug(f"write_batch:: batch failed, retrying: {e}")
+            for sql, params, many, future in batch:
+                try:
+                    with connection:
+                        connection.execute("BEGIN")
+                        result = execute_write(connection, sql, params, many)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            return
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
+        logging.debug(f"write_batch:: committed {len(batch)} writes.")
+
+    def write(self, sql, params=(), many: bool = False, wait=True):
+        """Queue a write for the writer thread.
+
+        Arguments:
+        ---------
+            sql: str or list -- SQL statement, or a list of (sql, params)
+                statements committed together, params is then unused
+            params: tuple -- parameters, a list of them if many is True
+            many: bool -- use executemany instead of execute
+            wait: bool -- wait until the write is committed
+        Returns:
+        -------
+            tuple or Future -- (changed rows, last inserted id) if wait is
+                True, a Future for it otherwise; of the last statement
+
+        """
+        if self.read_only:
+            raise sqlite3.OperationalError("database is opened read-only")
+        future = concurrent.futures.Future()
+        with self.write_lock:  # so close() cannot stop the writer meanwhile
+            if self.writer is None or not self.writer.is_alive():
+                raise sqlite3.OperationalError(
+                    "database writer is not running"
+                )
+            self.write_queue.put((sql, params, many, future))
+        return future.result() if wait else future
+
+    def flush(self):
+        """Wait until all writes queued so far are committed."""
+        if self.writer is not None:
+            self.write("SELECT 1")
+
     def create_table(self):
         """Create table iff does not exist."""
-        self.cursor.execute(
+        self.write(
             "CREATE TABLE IF NOT EXISTS amazon(url TEXT, price REAL, "
-            "datestamp TEXT, unix REAL, id INTEGER PRIMARY KEY AUTOINCREMENT)"
+            "datestamp TEXT, unix REAL, id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "delta REAL, changed INTEGER NOT NULL DEFAULT 0)"
+        )
+        # tables from before delta and changed existed are migrated, in
+        # one transaction so that no half migrated table is left behind
+        self.cursor.execute("PRAGMA table_info(amazon)")
+        columns = [row[1] for row in self.cursor.fetchall()]
+        migration = []
+        if "delta" not in columns:
+            migration.append(("ALTER TABLE amazon ADD COLUMN delta REAL", ()))
+        if "changed" not in columns:
+            migration.append(
+                (
+                    "ALTER TABLE amazon ADD COLUMN "
+                    "changed INTEGER NOT NULL DEFAULT 0",
+                    (),
+                )
+            )
+        if migration:
+            logging.debug("create_table:: adding delta and changed columns.")
+            self.write(migration + [self.update_deltas_statement()])
+        # previous price lookup of add_item_to_db, duplicate check of
+        # import_history and per URL history in time order
+        self.write(
+            "CREATE INDEX IF NOT EXISTS amazon_url_unix ON amazon(url, unix)"
+        )
+        # partial index: "what changed since" queries only read this index
+        self.write(
+            "CREATE INDEX IF NOT EXISTS amazon_changed "
+            "ON amazon(unix, url, price, delta) WHERE changed = 1"
+        )
+
+    def inspect_schema(self):
+        """Choose the tables to query, depending on the table's columns.
+
+        Read-only databases cannot be migrated by create_table, so for
+        tables without delta and changed these are computed by queries.
+
+        """
+        self.cursor.execute("PRAGMA table_info(amazon)")
+        columns = [row[1] for row in self.cursor.fetchall()]
+        if not columns:
+            raise sqlite3.OperationalError(
+                f"no amazon table in {self.db_file_path}"
+            )
+        if "delta" in columns:
+            self.table = "amazon"
+            self.changes_table = "amazon INDEXED BY amazon_changed"
+        else:
+            logging.debug("inspect_schema:: computing deltas in queries.")
+            self.table = DELTAS_FROM_HISTORY
+            self.changes_table = DELTAS_FROM_HISTORY
+
+    def update_deltas(self, urls=None):
+        """Recompute delta and changed of all rows, or of some URLs' rows.
+
+        delta is the difference to the previous valid price of the same
+        URL. Failed scrapes (-1) and prices that are not numbers are not
+        valid, they get no delta and never count as changed. A single
+        statement does it, so readers never see half updated rows.
+
+        Arguments:
+        ---------
+            urls: iterable -- only recompute rows of these URLs if given
+
+        """
+        self.write(*self.update_deltas_statement(urls))
+
+    def update_deltas_statement(self, urls=None) -> tuple:
+        """Get the (sql, params) statement of update_deltas."""
+        if urls is None:
+            deltas = DELTAS_FROM_HISTORY
+            params = ()
+        else:
+            deltas = DELTAS_FROM_HISTORY_WHERE.format(
+                where="url IN (SELECT value FROM json_each(:urls))"
+            )
+            params = {"urls": json.dumps(list(urls))}
+        return (
+            "UPDATE amazon SET delta = deltas.delta, changed = deltas.changed "
+            f"FROM {deltas} AS deltas WHERE amazon.id = deltas.id",
+            params,
         )
-        self.cursor.connection.commit()
 
     def close(self):
         """Close database."""
         logging.debug("close:: closing down database.")
-        self.cursor.connection.commit()
+        self.flush()
         logging.debug(f"close:: rows in db: {self.get_row_count()}")
         logging.debug(f"close:: db rows: {self.get_all_rows()}")
-        self.cursor.close()
-        self.cursor.connection.close()
+        # readers first, so that the writer is the last connection and
+        # its checkpoint leaves nothing behind in the -wal file
+        with self.readers_lock:
+            for connection in self.readers:
+                connection.close()
+            self.readers = []
+        self.local = threading.local()
+        self.stop_writer()
+
+    def stop_writer(self):
+        """Let the writer thread write what is queued, then stop it."""
+        with self.write_lock:
+            writer, self.writer = self.writer, None
+            if writer is not None:
+                self.write_queue.put(None)
+        if writer is not None:
+            writer.join()
+
+    def add_item_to_db(self, url: str, price: int, wait: bool = True):
+        """Add a new product to the database.
+
+        Arguments:
+        ---------
+            url:str -- product URL
+            price:int -- product price
+            wait:bool -- wait until committed, use flush() later if False
 
-    def add_item_to_db(self, url: str, price: int):
-        """Add a new product to the database."""
+        """
         unix = time.time()
         date = str(
             datetime.datetime.fromtimestamp(unix).strftime(
                 "%Y-%m-%-d %H:%M:%S"
             )
         )
-        self.cursor.execute(
-            "INSERT INTO amazon (url, price, datestamp, unix)"
-            "VALUES(?, ?, ?, ?)",
+        # delta to the previous valid price is computed by the insert
+        # itself, atomic as there is only one writer
+        future = self.write(
+            "INSERT INTO amazon (url, price, datestamp, unix, delta, changed) "
+            "SELECT ?1, ?2, ?3, ?4, delta, COALESCE(delta != 0, 0) FROM "
+            "(SELECT CASE WHEN typeof(?2) IN ('integer', 'real') "
+            "AND ?2 >= 0 THEN ?2 - (SELECT price FROM amazon WHERE url = ?1 "
+            "AND typeof(price) IN ('integer', 'real') AND price >= 0 "
+            "ORDER BY unix DESC, id DESC LIMIT 1) END AS delta)",
             (url, price, date, unix),
+            wait=False,
         )
-        self.cursor.connection.commit()
-        logging.debug(f"add_item_to_db: product for {url} added to db.")
-
-    def get_last_data(self, url: str):
-        """Get second but last price. If only one row exists return last price.
-
-        Arguments:
-        ---------
-            url:str -- URL entry in db, used to search for rows
-
-        """
-        self.cursor.execute(
-            "SELECT price FROM amazon WHERE url = ? "
-            "ORDER BY unix DESC LIMIT 2",
-            (url,),
+        # keep cached history current once the row is committed
+        future.add_done_callback(
+            partial(self.history.append_committed, url, unix, price)
         )
-        data = self.cursor.fetchall()
-        print(data)
-        return data[1] if len(data) > 1 else data[0]
+        if wait:
+            future.result()
+        logging.debug(f"add_item_to_db: product for {url} added to db.")
 
     def get_one_from_each_url(self):
         """Get one row for each URL."""
@@ -153,6 +500,163 @@ class ProductDatabase:
         data = self.cursor.fetchall()
         return data
 
+    def get_latest_prices(self) -> list:
+        """Get url, latest price, unixtime, id and delta for each URL.
+
+        Failed scrapes (-1) and prices that are not numbers are skipped,
+        so the latest valid price of each URL is returned.
+
+        """
+        self.cursor.execute(
+            f"SELECT url, price, unix, id, delta FROM {self.table} "
+            "WHERE id IN (SELECT id FROM "
+            "(SELECT id, MAX(unix) FROM amazon "
+            "WHERE typeof(price) IN ('integer', 'real') AND price >= 0 "
+            "GROUP BY url)) "
+            "ORDER BY id ASC"
+        )
+        data = self.cursor.fetchall()
+        return data
+
+    def get_downsampled_history(self, url: str, points: int) -> list:
+        """Get at most points (unixtime, price) averages for a URL.
+
+        The time range of the URL is split into equally long buckets and
+        the samples of each bucket are averaged. Failed scrapes (-1) and
+        prices that are not numbers are left out.
+
+        Arguments:
+        ---------
+            url:str -- URL entry in db, used to search for rows
+            points:int -- maximum number of buckets returned
+
+        """
+        self.cursor.execute(
+            "WITH bounds AS (SELECT MIN(unix) AS first, "
+            "(MAX(unix) - MIN(unix)) / ? AS width "
+            "FROM amazon WHERE url = ? "
+            "AND typeof(price) IN ('integer', 'real') AND price >= 0) "
+            "SELECT AVG(unix), AVG(price) FROM amazon, bounds "
+            "WHERE url = ? AND typeof(price) IN ('integer', 'real') "
+            "AND price >= 0 "
+            "GROUP BY CASE WHEN width > 0 THEN "
+            "MIN(CAST((unix - first) / width AS INTEGER), ? - 1) "
+            "ELSE 0 END ORDER BY 1 ASC",
+            (points, url, url, points),
+        )
+        data = self.cursor.fetchall()
+        return data
+
+    def get_rows_since(self, last_id: int) -> list:
+        """Get id, url, unixtime, price and delta of rows after last_id.
+
+        Arguments:
+        ---------
+            last_id:int -- only rows with a larger id are returned
+
+        """
+        self.cursor.execute(
+            f"SELECT id, url, unix, price, delta FROM {self.table} "
+            "WHERE id > ? ORDER BY id ASC",
+            (last_id,),
+        )
+        data = self.cursor.fetchall()
+        return data
+
+    def get_changes_since(self, unix: float) -> list:
+        """Get id, url, unixtime, price and delta of changes after unix.
+
+        Only reads the partial index of changed rows.
+
+        Arguments:
+        ---------
+            unix:float -- only changes after this unixtime are returned
+
+        """
+        self.cursor.execute(
+            f"SELECT id, url, unix, price, delta FROM {self.changes_table} "
+            "WHERE changed = 1 AND unix > ? ORDER BY unix ASC",
+            (unix,),
+        )
+        data = self.cursor.fetchall()
+        return data
+
+    def get_movers_since(self, unix: float) -> list:
+        """Get url, unixtime, price and delta of each URL's last change.
+
+        Only URLs whose price changed after unix are returned. Only reads
+        the partial index of changed rows.
+
+        Arguments:
+        ---------
+            unix:float -- only changes after this unixtime are considered
+
+        """
+        # SQLite takes the bare columns from the row holding MAX(unix)
+        self.cursor.execute(
+            f"SELECT url, MAX(unix), price, delta FROM {self.changes_table} "
+            "WHERE changed = 1 AND unix > ? GROUP BY url",
+            (unix,),
+        )
+        data = self.cursor.fetchall()
+        return data
+
+    def get_last_id(self) -> int:
+        """Get the id of the last inserted row, 0 if there is none."""
+        self.cursor.execute("SELECT MAX(id) FROM amazon")
+        data = self.cursor.fetchone()
+        return data[0] or 0
+
+    def get_data_version(self) -> int:
+        """Get the SQLite data version, it changes on foreign commits."""
+        self.cursor.execute("PRAGMA data_version")
+        return self.cursor.fetchone()[0]
+
+    def iter_price_history(self):
+        """Yield (url, unixtime, price) of all rows, ordered by URL and time.
+
+        Failed scrapes (-1) and prices that are not numbers are left out.
+
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT url, unix, price FROM amazon ORDER BY url ASC, unix ASC"
+        )
+        try:
+            for url, unix, price in cursor:
+                price = price_to_float(price)
+                if price >= 0:  # False for NaN too
+                    yield url, unix, price
+        finally:
+            cursor.close()
+
+    def iter_id_unixtime_price_for_url(self, url: str):
+        """Yield id, unixtime and price for rows matching URL, by unixtime.
+
+        Arguments:
+        ---------
+            url:str -- URL entry in db, used to search for rows
+
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT id, unix, price FROM amazon WHERE url = ? "
+            "ORDER BY unix, id",
+            (url,),
+        )
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def get_unixtimes_since(self, unix: float) -> list:
+        """Get the unixtimes of rows added after unixtime unix, ascending."""
+        self.cursor.execute(
+            "SELECT unix FROM amazon WHERE unix > ? ORDER BY unix ASC",
+            (unix,),
+        )
+        return [row[0] for row in self.cursor.fetchall()]
+
     def get_row_count(self) -> int:
         """Get number of rows.
 
@@ -174,8 +678,8 @@ class ProductDatabase:
 
         """
         # Set url to deleted
-        self.cursor.execute("DELETE FROM amazon WHERE url = ?", (url,))
-        self.cursor.connection.commit()
+        self.write("DELETE FROM amazon WHERE url = ?", (url,))
+        self.history.discard(url)
 
     def value_already_exists(self, url: str) -> bool:
         """Determine if the product already exists."""
@@ -183,6 +687,326 @@ class ProductDatabase:
         return True if self.cursor.fetchone() else False
         # True if one is found
 
+    def iter_history_chunks(
+        self, since_id: int = 0, chunk_size: int = EXPORT_CHUNK_SIZE
+    ):
+        """Yield rows with id greater than since_id, chunk_size at a time.
+
+        Arguments:
+        ---------
+            since_id:int -- watermark, only rows with a larger id are read
+            chunk_size:int -- maximum number of rows per chunk
+        Yields:
+        ------
+            list -- rows of (id, url, price, datestamp, unix)
+
+        """
+        # own cursor, so that self.cursor can be used while streaming
+        # (the connection belongs to the calling thread)
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT id, url, price, datestamp, unix FROM amazon "
+            "WHERE id > ? ORDER BY id ASC",
+            (since_id,),
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def export_history(
+        self,
+        file_path: str,
+        since_id: int = 0,
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+    ) -> int:
+        """Export price history to a columnar file, chunk by chunk.
+
+        Parquet is written for *.parquet files, compressed NumPy
+        archives for *.npz files. Memory use is bounded by chunk_size.
+
+        Arguments:
+        ---------
+            file_path:str -- path and name of the export file
+            since_id:int -- watermark, only rows with a larger id are exported
+            chunk_size:int -- maximum number of rows held in memory
+        Returns:
+        -------
+            int -- new watermark, i.e. the largest exported id
+
+        """
+        file_format = columnar_format(file_path)
+        chunks = self.iter_history_chunks(since_id, chunk_size)
+        if file_format == "parquet":
+            watermark = write_parquet_chunks(file_path, chunks, since_id)
+        else:
+            watermark = write_npz_chunks(file_path, chunks, since_id)
+        logging.debug(
+            f"export_history:: exported rows {since_id} < id <= "
+            f"{watermark} to {file_path}."
+        )
+        return watermark
+
+    def import_history(
+        self, file_path: str, chunk_size: int = EXPORT_CHUNK_SIZE
+    ) -> int:
+        """Import price history from a columnar file, chunk by chunk.
+
+        Rows get new ids. Rows whose URL and unixtime already exist are
+        skipped and counted, so importing the same file twice, or an
+        export of another database, is harmless.
+
+        Arguments:
+        ---------
+            file_path:str -- path and name of a *.parquet or *.npz file
+            chunk_size:int -- maximum number of rows held in memory
+        Returns:
+        -------
+            int -- number of rows inserted
+
+        """
+        file_format = columnar_format(file_path)
+        if file_format == "parquet":
+            chunks = read_parquet_chunks(file_path, chunk_size)
+        else:
+            chunks = read_npz_chunks(file_path)
+        urls = set()  # only these need their deltas recomputed
+        read = 0
+        inserted = 0
+        for rows in chunks:
+            urls.update(row[1] for row in rows)
+            # ?1 is the id in the file, which is not kept
+            inserted += self.write(
+                "INSERT INTO amazon (url, price, datestamp, unix) "
+                "SELECT ?2, ?3, ?4, ?5 WHERE NOT EXISTS "
+                "(SELECT 1 FROM amazon WHERE url = ?2 AND unix = ?5)",
+                rows,
+                many=True,
+            )[0]
+            read += len(rows)
+        # imported rows may be older than cached ones
+        self.history.clear()
+        self.update_deltas(urls)
+        logging.debug(
+            f"import_history:: imported {inserted} rows from {file_path}."
+        )
+        if read > inserted:
+            logging.info(
+                f"import_history:: skipped {read - inserted} rows of "
+                f"{file_path} already in the database."
+            )
+        return inserted
+
+
+################################################################
+# Class PriceSeries
+################################################################
+
+
+class PriceSeries:
+    """Price history of one product as two array('d') columns.
+
+    A sample costs 16 bytes, about 16 MB per million samples, instead of
+    roughly 110 bytes for a (unixtime, price) tuple in a list.
+    """
+
+    __slots__ = ("times", "prices", "last_id")
+
+    def __init__(self, rows):
+        """Initialize the class methods and instance variables.
+
+        Arguments:
+        ---------
+            rows: iterable -- (id, unixtime, price) rows ordered by unixtime
+
+        """
+        self.times = array("d")
+        self.prices = array("d")
+        self.last_id = 0  # largest id in the series
+        for row_id, unix, price in rows:
+            self.times.append(unix)
+            self.prices.append(price_to_float(price))
+            self.last_id = max(self.last_id, row_id)
+
+    def append(self, row_id: int, unix: float, price: float):
+        """Append a sample unless it is already part of the series."""
+        if row_id > self.last_id:
+            self.times.append(unix)
+            self.prices.append(price_to_float(price))
+            self.last_id = row_id
+
+    def contains(self, unix: float) -> bool:
+        """Determine if a sample taken at unixtime unix is in the series."""
+        index = bisect.bisect_left(self.times, unix)
+        return index < len(self.times) and self.times[index] == unix
+
+    def nbytes(self) -> int:
+        """Get the number of bytes used by the samples."""
+        return (len(self.times) + len(self.prices)) * self.times.itemsize
+
+
+################################################################
+# Class PriceHistoryCache
+################################################################
+
+
+class PriceHistoryCache:
+    """In-process cache of PriceSeries, least recently used evicted first.
+
+    Series are loaded from the database on first use and then kept
+    current by appending every committed add_item_to_db. Series are
+    evicted while the cache uses more than max_bytes.
+
+    Series are loaded without holding the lock, and the writer thread
+    only queues its commits in pending, so neither a slow load nor a
+    busy reader holds up the writer.
+    """
+
+    def __init__(self, db: "ProductDatabase", max_bytes: int):
+        """Initialize the class methods and instance variables.
+
+        Arguments:
+        ---------
+            db: ProductDatabase -- database to load series from
+            max_bytes: int -- memory budget for all cached samples
+
+        """
+        self.db = db
+        self.max_bytes = max_bytes
+        self.series = collections.OrderedDict()  # url -> PriceSeries
+        self.nbytes = 0
+        self.lock = threading.Lock()  # the cache is shared by all threads
+        # (url, id, unixtime, price) committed by the writer thread
+        self.pending = queue.SimpleQueue()
+        # url -> committed rows, for series being loaded
+        self.loading = {}
+
+    def get(self, url: str) -> PriceSeries:
+        """Get the price history of url, load it if not cached."""
+        with self.lock:
+            self.apply_pending()
+            series = self.series.get(url)
+            if series is not None:
+                self.series.move_to_end(url)
+                return series
+            committed = self.loading.setdefault(url, [])
+        try:
+            loaded = PriceSeries(self.db.iter_id_unixtime_price_for_url(url))
+        except BaseException:
+            with self.lock:
+                if self.loading.get(url) is committed:
+                    del self.loading[url]
+            raise
+        with self.lock:
+            self.apply_pending()
+            if self.loading.get(url) is committed:
+                del self.loading[url]
+            series = self.series.get(url)
+            if series is not None:  # loaded by another thread meanwhile
+                self.series.move_to_end(url)
+                return series
+            # commits while loading, unless the load already saw them
+            for row_id, unix, price in committed:
+                loaded.append(row_id, unix, price)
+            self.series[url] = loaded
+            self.nbytes += loaded.nbytes()
+            self.evict()
+            return loaded
+
+    def append_committed(self, url: str, unix: float, price: float, future):
+        """Queue a committed insert of add_item_to_db for its series.
+
+        Used as done callback of the insert's Future, so it runs in the
+        writer thread and must not wait for the lock.
+
+        """
+        if future.exception() is None:
+            self.pending.put((url, future.result()[1], unix, price))
+
+    def apply_pending(self):
+        """Append the queued commits to their series, with the lock held."""
+        while True:
+            try:
+                url, row_id, unix, price = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if url in self.loading:
+                self.loading[url].append((row_id, unix, price))
+            series = self.series.get(url)
+            if series is not None:
+                self.append_sample(url, series, row_id, unix, price)
+        self.evict()
+
+    def append_sample(
+        self, url: str, series: PriceSeries, row_id: int, unix, price
+    ):
+        """Append a new row to the series of url, with the lock held.
+
+        A row older than the series' last row (e.g. committed by another
+        process with an older unixtime) cannot be appended in order, so
+        the series is dropped and loaded again on next use.
+
+        """
+        if row_id <= series.last_id:
+            return
+        if series.times and unix < series.times[-1]:
+            del self.series[url]
+            self.nbytes -= series.nbytes()
+            return
+        before = series.nbytes()
+        series.append(row_id, unix, price)
+        self.nbytes += series.nbytes() - before
+
+    def append_rows(self, rows: list):
+        """Append rows of get_rows_since to the cached series.
+
+        Rows already in a series are skipped, so rows written by other
+        processes can be fed in without duplicating our own. A missing
+        row with an id below the series' last id (committed by another
+        process before one of ours) cannot be appended, so the series is
+        dropped and loaded again on next use, as for rows out of time
+        order.
+
+        """
+        with self.lock:
+            self.apply_pending()
+            for row_id, url, unix, price, _ in rows:
+                series = self.series.get(url)
+                if series is None:
+                    continue
+                if row_id > series.last_id:
+                    self.append_sample(url, series, row_id, unix, price)
+                elif not series.contains(unix):
+                    del self.series[url]
+                    self.nbytes -= series.nbytes()
+            self.evict()
+
+    def evict(self):
+        """Evict least recently used series until within the budget."""
+        # the most recently used series is kept, even if it is too big
+        while self.nbytes > self.max_bytes and len(self.series) > 1:
+            _, series = self.series.popitem(last=False)
+            self.nbytes -= series.nbytes()
+
+    def discard(self, url: str):
+        """Remove the series of url, e.g. after its rows were deleted."""
+        with self.lock:
+            self.apply_pending()
+            series = self.series.pop(url, None)
+            if series is not None:
+                self.nbytes -= series.nbytes()
+
+    def clear(self):
+        """Remove all series."""
+        with self.lock:
+            self.apply_pending()
+            self.series.clear()
+            self.nbytes = 0
+
 
 ################################################################
 # Class ProductWindow
@@ -209,14 +1033,17 @@ class ProductWindow(QMainWindow):
         self.setWindowTitle("Track Amazon products")
         self.init_ui()
         self.update_current_data_value()
-        self.init_labels()  # requires cursor set
+        self.init_labels()
+        # poll for new prices, also those written by other processes
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_due_products)
+        self.refresh_timer.timeout.connect(self.refresh_labels)
+        self.refresh_timer.start(LABEL_REFRESH_INTERVAL_MS)
 
     def new_vars(self, args: argparse.Namespace, db: ProductDatabase):
         """Create and initialize instance variables."""
         self.args = args
         self.db = db
-        self.cursor = db.cursor  # sqlite3 db cursor
-        # we can get the sqlite3 connection from cursor: cursor.connection
         self.height = 140
         self.width = 30
         self.WIDTH_CLOSE_BUTTON = 600
@@ -261,12 +1088,12 @@ class ProductWindow(QMainWindow):
         try:
             split_url = url.split("/")
             if split_url[3] == "dp":  # index 3 might not exist
-                return get_product_name(url)
+                return get_product_name(url, self.args.fetcher)
             else:
                 return split_url[3]
         except Exception as e:
             logging.info(f"shorten_url:: exception occurred: {e}")
-            return get_product_name(url)
+            return get_product_name(url, self.args.fetcher)
 
     def init_labels(self):
         """Initialize labels."""
@@ -276,29 +1103,65 @@ class ProductWindow(QMainWindow):
         self.graph_buttons = []
         self.products_index = 0
         self.PRODUCTS_SPACE_DIFFERENCE = 50
+        # url -> [label, product number, short url], for refresh_labels
+        self.product_labels = {}
         logging.debug(f"init_labels:: {self.data}")
-        data = self.db.get_one_from_each_url()
+        # rows after last_id are picked up by refresh_labels
+        self.last_id = self.db.get_last_id()
+        data = self.db.get_latest_prices()
         self.add_label(data)
 
+    def refresh_labels(self):
+        """Update the labels of products with new rows in the database.
+
+        Only products with rows added since the last call are touched, so
+        the cost depends on the number of changes, not of products.
+        Failed scrapes (-1) and prices that are not numbers are not shown,
+        the labels keep the last valid price.
+
+        """
+        rows = self.db.get_rows_since(self.last_id)
+        if not rows:
+            return
+        self.last_id = rows[-1][0]
+        self.db.history.append_rows(rows)
+        latest = {}  # url -> latest row with a valid price
+        for row in rows:
+            if isinstance(row[3], (int, float)) and row[3] >= 0:
+                latest[row[1]] = row
+        for row_id, url, unix, price, delta in latest.values():
+            if url in self.product_labels:
+                self.update_label(url, price, delta)
+            else:  # added by another process
+                self.add_label([(url, price, unix, row_id, delta)])
+        logging.debug(
+            f"refresh_labels:: {len(rows)} new rows, "
+            f"{len(latest)} products updated."
+        )
+
+    def update_label(self, url: str, price: int, delta: float):
+        """Show the new price of an existing product and recolour it."""
+        label, number, short_url = self.product_labels[url]
+        label.setText(self.label_text(number, price, short_url))
+        label.adjustSize()
+        self.set_label_color(label, delta_direction(delta))
+
     def add_label(self, newData):
-        """Add label when the add label is called."""
+        """Add label when the add label is called.
+
+        Arguments:
+        ---------
+            newData: list -- rows of (url, price) for new products, or of
+                (url, price, unixtime, id, delta) like get_latest_prices()
+
+        """
         print(self.height)
         for row in newData:
             url = row[0]
             price = row[1]
-            last_data = self.db.get_last_data(url)[0]
-            try:
-                # TODO: this is still old. fix it, and try to not have to
-                # use the price into int only once and save it like an int in
-                # the db
-                bigger = which_is_more_expensive(price, last_data)
-                logging.debug(f"add_label:: Which is bigger {bigger}")
-                logging.debug(f"add_label:: {last_data} vs {price}")
-            except ValueError:  # catch *all* exceptions
-                e = sys.exc_info()[0]
-                logging.error(
-                    f"add_label:: Caught exception\n{e}\n{url}\n{self.data}."
-                )
+            # direction is stored by add_item_to_db, no need to compare
+            bigger = delta_direction(row[4] if len(row) > 4 else None)
+            logging.debug(f"add_label:: Which is bigger {bigger}")
 
             # Create the label and define the color
             new_label = self.create_new_label(url, price)
@@ -340,16 +1203,20 @@ class ProductWindow(QMainWindow):
         elif bigger == 0:
             label.setStyleSheet(COLOR_BLUE)
 
+    def label_text(self, number: int, price: int, short_url: str) -> str:
+        """Get the text of a product label."""
+        return f"Product {number}: {str(price)}€\n{short_url}"
+
     def create_new_label(self, url: str, price: int):
         """Create a new label."""
         short_url = self.shorten_url(url)
+        number = self.products_index + 1
 
         new_label = QtWidgets.QLabel(self)
-        new_label.setText(
-            f"Product {(self.products_index+1)}: {str(price)}€\n{short_url}"
-        )
+        new_label.setText(self.label_text(number, price, short_url))
         new_label.move(self.width, self.height)
         new_label.adjustSize()
+        self.product_labels[url] = [new_label, number, short_url]
         return new_label
 
     def create_new_close_button(
@@ -423,6 +1290,8 @@ class ProductWindow(QMainWindow):
 
         self.height -= self.PRODUCTS_SPACE_DIFFERENCE
         self.db.delete_rows_for_url(url)
+        self.scheduler.remove(url)
+        self.product_labels.pop(url, None)
         self.replace_products(index)
 
     def replace_products(self, product_index: int):
@@ -456,17 +1325,14 @@ class ProductWindow(QMainWindow):
 
     def show_product_price_graph(self, url):
         """Show a graph of the products price passed through the argument."""
-        data = self.db.get_unixtime_price_for_url(url)
+        series = self.db.history.get(url)
         # do not use strings with plot, use float and datetime
-        dates_datetime = []
-        prices = []
-
-        for row in data:
-            dates_datetime.append(datetime.datetime.fromtimestamp(row[0]))
-            prices.append(row[1])
+        dates_datetime = [
+            datetime.datetime.fromtimestamp(unix) for unix in series.times
+        ]
 
         # already set logger level to INFO in init() to avoid spam
-        plot.plot_date(dates_datetime, prices, "-")
+        plot.plot_date(dates_datetime, series.prices, "-")
         plot.show()
 
     def new_value(self, url: str):
@@ -476,6 +1342,7 @@ class ProductWindow(QMainWindow):
             return
         value_exists = self.db.value_already_exists(url)
         price = get_price(self.args, url)
+        self.record_scrape(url, price)
         if not value_exists:
             if price != -1:
                 values = [(url, price)]
@@ -486,33 +1353,873 @@ class ProductWindow(QMainWindow):
             # already exists, but update the price
             if price != -1:
                 self.db.add_item_to_db(url, price)
+                self.refresh_labels()
                 logging.debug(f"new_value: product price for {url} updated.")
 
     def update_current_data_value(self):
-        """Check products in self.data if the price is correct."""
-        data_copy = self.data.copy()
-        for row in data_copy:
-            url = row[0]
-            price = get_price(self.args, url)
-            if price != ERROR_MSG_429:
-                self.db.add_item_to_db(url, price)
+        """Set up refresh scheduling and check the products already due.
+
+        Which products are due is decided by a RefreshScheduler learned
+        from the price history. It is kept on the window and consulted
+        again by refresh_due_products on every timer tick. Scrapes of
+        the last 24 hours count against the daily budget. Scraping runs
+        in a scraper thread, so that the window stays responsive.
+
+        """
+        now = time.time()
+        self.scraper = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ProductWindow-scraper"
+        )
+        self.scrape_job = None  # Future of the scrapes under way
+        self.scheduler = RefreshScheduler(self.args.refresh_budget)
+        self.scheduler.learn(self.db.iter_price_history())
+        for row in self.data:
+            # no successful scrape yet, so due right away
+            self.scheduler.add(row[0], 0.0)
+        # unixtimes of the scrapes counting against the daily budget
+        self.scrape_times = collections.deque(
+            self.db.get_unixtimes_since(now - SECONDS_PER_DAY)
+        )
+        self.refresh_due_products()
         # self.save_data()
 
+    def refresh_due_products(self):
+        """Scrape the products due for a check, within the daily budget.
+
+        The scraper thread stores the prices, the labels pick them up from
+        the database. The scheduler is only used by the GUI thread, it
+        learns the results on the first timer tick after the scrapes.
+
+        """
+        if self.scrape_job is not None:
+            if not self.scrape_job.done():
+                return  # still scraping the products due last time
+            try:
+                for url, unix, price in self.scrape_job.result():
+                    self.record_scrape(url, price, unix)
+            except Exception as e:
+                logging.error(f"refresh_due_products:: scrapes failed: {e}")
+            self.scrape_job = None
+        now = time.time()
+        day_ago = now - SECONDS_PER_DAY
+        while self.scrape_times and self.scrape_times[0] <= day_ago:
+            self.scrape_times.popleft()
+        limit = max(self.args.refresh_budget - len(self.scrape_times), 0)
+        due = self.scheduler.due(now, limit)
+        if not due:
+            return
+        logging.debug(
+            f"refresh_due_products:: refreshing {len(due)} of "
+            f"{len(self.scheduler.products)} products."
+        )
+        self.scrape_job = self.scraper.submit(self.scrape, due)
+
+    def scrape(self, urls: list) -> list:
+        """Scrape the URLs and queue their prices, in the scraper thread.
+
+        Arguments:
+        ---------
+            urls: list -- URLs to scrape
+        Returns:
+        -------
+            list -- (url, unixtime, price) of each scrape, -1 if failed
+
+        """
+        results = []
+        for url in urls:
+            price = get_price(self.args, url)
+            if price != -1:  # failed scrapes are not stored
+                self.db.add_item_to_db(url, price, wait=False)
+            results.append((url, time.time(), price))
+        return results
+
+    def record_scrape(self, url: str, price, now: float = None):
+        """Count a scrape against the budget and teach the scheduler."""
+        if now is None:
+            now = time.time()
+        self.scrape_times.append(now)
+        if isinstance(price, (int, float)) and price >= 0:
+            self.scheduler.add(url, now)
+            self.scheduler.record(url, now, price)
+        elif url in self.scheduler.products:
+            self.scheduler.record(url, now, None)  # checked, but no price
+
+
+################################################################
+# Class RefreshScheduler
+################################################################
+
+
+class RefreshScheduler:
+    """Decide when to check the price of each product.
+
+    The change rate of each product is estimated from its history, the
+    number of observed price changes per second smoothed with a prior.
+    A daily scrape budget is split among the products in proportion to
+    the square root of their change rate, which maximizes the number of
+    caught changes for Poisson distributed changes. Volatile products are
+    therefore checked more often, stable ones less often.
+    """
+
+    def __init__(
+        self,
+        budget_per_day: float,
+        min_interval: float = MIN_REFRESH_INTERVAL,
+        max_interval: float = MAX_REFRESH_INTERVAL,
+        adaptive: bool = True,
+    ):
+        """Initialize the class methods and instance variables.
+
+        Arguments:
+        ---------
+            budget_per_day: float -- scrapes per day for all products
+            min_interval: float -- shortest check interval in seconds
+            max_interval: float -- longest check interval in seconds
+            adaptive: bool -- False gives every product the same interval
+
+        """
+        self.budget_per_day = budget_per_day
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.adaptive = adaptive
+        # url -> [changes, observed seconds, last check, last price]
+        self.products = {}
+        self.intervals = None  # url -> seconds, None when outdated
+
+    def learn(self, history):
+        """Learn change rates from (url, unixtime, price) rows.
+
+        Arguments:
+        ---------
+            history: iterable -- rows ordered by URL and unixtime, such as
+                ProductDatabase.iter_price_history()
+
+        """
+        for url, unix, price in history:
+            if url not in self.products:
+                self.products[url] = [0, 0.0, unix, price]
+            else:
+                self.record(url, unix, price)
+        self.intervals = None
+
+    def add(self, url: str, unix: float):
+        """Add a product without history, treated as checked at unix."""
+        if url not in self.products:
+            self.products[url] = [0, 0.0, unix, None]
+            self.intervals = None
+
+    def remove(self, url: str):
+        """Stop scheduling url, e.g. after the product was removed."""
+        if self.products.pop(url, None) is not None:
+            self.intervals = None
+
+    def record(self, url: str, unix: float, price: float) -> bool:
+        """Record a price check, return True if the price changed.
+
+        A price of None records a failed check, which only moves the
+        next check of url.
+
+        """
+        product = self.products[url]
+        if price is None:
+            product[2] = unix
+            return False
+        changed = product[3] is not None and price != product[3]
+        product[0] += changed
+        product[1] += max(unix - product[2], 0)
+        product[2] = unix
+        product[3] = price
+        self.intervals = None
+        return changed
+
+    def rate(self, url: str) -> float:
+        """Get the estimated number of price changes per second."""
+        changes, observed = self.products[url][:2]
+        return (changes + PRIOR_CHANGES) / (observed + PRIOR_SECONDS)
+
+    def interval(self, url: str) -> float:
+        """Get the number of seconds between two checks of url."""
+        if self.intervals is None:
+            weights = {
+                url: math.sqrt(self.rate(url)) if self.adaptive else 1.0
+                for url in self.products
+            }
+            total = sum(weights.values())
+            self.intervals = {
+                url: min(
+                    max(
+                        SECONDS_PER_DAY * total
+                        / (self.budget_per_day * weight),
+                        self.min_interval,
+                    ),
+                    self.max_interval,
+                )
+                if self.budget_per_day > 0
+                else self.max_interval
+                for url, weight in weights.items()
+            }
+        return self.intervals[url]
+
+    def due(self, now: float, limit: int = None) -> list:
+        """Get the URLs due for a check, most overdue first.
+
+        Arguments:
+        ---------
+            now: float -- current unixtime
+            limit: int -- maximum number of URLs returned, None for all
+        Returns:
+        -------
+            list -- URLs to check now
+
+        """
+        overdue = []
+        for url, product in self.products.items():
+            ratio = (now - product[2]) / self.interval(url)
+            if ratio >= 1:
+                overdue.append((ratio, url))
+        overdue.sort(reverse=True)
+        return [url for _, url in overdue[:limit]]
+
+
+################################################################
+# Class LiveFetch
+################################################################
+
+
+class LiveFetch:
+    """Fetch backend downloading pages from the web.
+
+    A fetch backend has fetch(url), returning the page as bytes or
+    raising urllib.request.HTTPError or another exception, and close().
+    """
+
+    def fetch(self, url: str) -> bytes:
+        """Download url."""
+        with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+            return response.read()
+
+    def close(self):
+        """Release resources, nothing to do for live fetches."""
+
+
+################################################################
+# Class RecordFetch
+################################################################
+
+
+class RecordFetch:
+    """Fetch backend recording the responses of another backend.
+
+    Every response, or error, is appended with its URL, start time and
+    duration as one JSON line to a gzip compressed archive, to be served
+    again by ReplayFetch. Each line is written and flushed as a gzip
+    member of its own, so the archive stays readable if the program is
+    killed while recording.
+    """
+
+    def __init__(self, archive_path: str, backend=None):
+        """Initialize the class methods and instance variables.
+
+        Arguments:
+        ---------
+            archive_path: str -- path and name of the archive (*.jsonl.gz)
+            backend: fetch backend to record, LiveFetch by default
+
+        """
+        self.backend = backend if backend is not None else LiveFetch()
+        self.archive = open(archive_path, "ab")
+        self.lock = threading.Lock()
+
+    def fetch(self, url: str) -> bytes:
+        """Fetch url with the recorded backend and record the response."""
+        record = {"url": url, "time": time.time()}
+        start = time.perf_counter()
+        try:
+            body = self.backend.fetch(url)
+        except urllib.request.HTTPError as e:
+            record["status"] = e.code
+            record["error"] = str(e.reason)
+            raise
+        except Exception as e:
+            record["status"] = 0
+            record["error"] = str(getattr(e, "reason", e))  # URLError
+            raise
+        else:
+            record["status"] = 200
+            record["body"] = base64.b64encode(body).decode("ascii")
+            return body
+        finally:
+            record["elapsed"] = time.perf_counter() - start
+            with self.lock:
+                line = json.dumps(record) + "\n"
+                self.archive.write(gzip.compress(line.encode("utf-8")))
+                self.archive.flush()
+
+    def close(self):
+        """Close the archive."""
+        self.backend.close()
+        with self.lock:
+            self.archive.close()
+
+
+################################################################
+# Class ReplayFetch
+################################################################
+
+
+class ReplayFetch:
+    """Fetch backend serving responses recorded by RecordFetch.
+
+    Responses for a URL are served in recorded order. When they run
+    out, the last one is served again. Each fetch takes the recorded
+    duration divided by speed, so speed=0 serves as fast as possible.
+    Only the position of each record in the archive is kept in memory,
+    records are read and decoded when they are served.
+    """
+
+    def __init__(self, archive_path: str, speed: float = 1.0):
+        """Initialize the class methods and instance variables.
+
+        Arguments:
+        ---------
+            archive_path: str -- path and name of the archive (*.jsonl.gz)
+            speed: float -- replay speed, 0 disables the recorded timing
+
+        """
+        self.speed = speed
+        # url -> (offset, length, line) of its records' gzip members
+        self.responses = {}
+        self.positions = collections.Counter()  # url -> next record
+        self.lock = threading.Lock()  # for positions and the archive
+        self.archive = open(archive_path, "rb")
+        self.index_archive()
+        logging.debug(
+            f"ReplayFetch:: {sum(map(len, self.responses.values()))} "
+            f"responses for {len(self.responses)} URLs indexed."
+        )
+
+    def index_archive(self):
+        """Find the gzip member of every record in the archive."""
+        offset = 0  # of the current member in the archive
+        position = 0  # bytes of the archive decompressed so far
+        decompressor = zlib.decompressobj(wbits=31)  # gzip format
+        lines = bytearray()
+        read = partial(self.archive.read, REPLAY_READ_SIZE)
+        for data in iter(read, b""):
+            while data:
+                try:
+                    lines += decompressor.decompress(data)
+                except zlib.error as e:
+                    logging.warning(f"ReplayFetch:: corrupt archive: {e}")
+                    return
+                if not decompressor.eof:
+                    position += len(data)
+                    break
+                data = decompressor.unused_data  # next members
+                position = self.archive.tell() - len(data)
+                if not self.index_member(lines, offset, position - offset):
+                    return
+                offset = position
+                decompressor = zlib.decompressobj(wbits=31)
+                lines = bytearray()
+        if position > offset:
+            # recording was killed while writing its last record
+            logging.warning("ReplayFetch:: truncated archive.")
+
+    def index_member(self, lines: bytes, offset: int, length: int) -> bool:
+        """Index the records of one gzip member, False if corrupt."""
+        for line, text in enumerate(lines.splitlines()):
+            try:
+                url = json.loads(text)["url"]
+            except (json.JSONDecodeError, KeyError) as e:
+                logging.warning(f"ReplayFetch:: corrupt record: {e}")
+                return False
+            self.responses.setdefault(url, []).append((offset, length, line))
+        return True
+
+    def fetch(self, url: str) -> bytes:
+        """Serve the next recorded response for url."""
+        records = self.responses.get(url)
+        if records is None:
+            raise urllib.request.URLError(f"{url} is not in the archive")
+        with self.lock:
+            offset, length, line = records[
+                min(self.positions[url], len(records) - 1)
+            ]
+            self.positions[url] += 1
+            self.archive.seek(offset)
+            member = self.archive.read(length)
+        record = json.loads(gzip.decompress(member).splitlines()[line])
+        if self.speed > 0:
+            time.sleep(record["elapsed"] / self.speed)
+        if record["status"] == 200:
+            return base64.b64decode(record["body"])
+        if record["status"] == 0:
+            raise urllib.request.URLError(record["error"])
+        raise urllib.request.HTTPError(
+            url, record["status"], record["error"], None, None
+        )
+
+    def close(self):
+        """Close the archive."""
+        with self.lock:
+            self.archive.close()
+
+
+################################################################
+# Class ProductApi
+################################################################
+
+
+class ProductApi:
+    """Answer read-only JSON queries about the tracked products.
+
+    Responses are cached. The cache is keyed on the last inserted id and
+    the known, normalized query parameters, and dropped whenever SQLite
+    reports a commit by another connection (e.g. deleted rows), so
+    repeated polling costs one small query. At most API_CACHE_SIZE
+    responses are kept, least recently used evicted first. Queries run
+    on the read-only connection of the calling thread.
+    """
+
+    def __init__(self, db: ProductDatabase):
+        """Initialize the class methods and instance variables.
+
+        Arguments:
+        ---------
+            db: ProductDatabase -- database to query
+
+        """
+        self.db = db
+        self.cache = collections.OrderedDict()  # (path, params) -> response
+        self.lock = threading.Lock()  # the cache is shared by all workers
+        self.last_id = None  # last id the cached responses belong to
+        self.data_versions = {}  # thread id -> last seen data_version
+
+    def get(self, path: str, query: dict) -> tuple:
+        """Get the response for a request.
+
+        Arguments:
+        ---------
+            path: str -- request path, e.g. /products
+            query: dict -- parsed query string
+        Returns:
+        -------
+            tuple -- (HTTP status, ETag or None, JSON body as bytes)
+
+        """
+        thread_id = threading.get_ident()
+        data_version = self.db.get_data_version()
+        last_id = self.db.get_last_id()
+        try:
+            params = self.params(path, query)
+        except KeyError as e:
+            return 404, None, json_body({"error": f"not found: {e}"})
+        except ValueError as e:
+            return 400, None, json_body({"error": str(e)})
+        key = (path, tuple(sorted(params.items())))
+        with self.lock:
+            if (
+                self.data_versions.get(thread_id, data_version)
+                != data_version
+                or last_id != self.last_id
+            ):
+                self.cache.clear()
+                self.last_id = last_id
+            self.data_versions[thread_id] = data_version
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                etag, body = self.cache[key]
+                return 200, etag, body
+        try:
+            result = self.query(self.db, path, params)
+        except KeyError as e:
+            return 404, None, json_body({"error": f"not found: {e}"})
+        body = json_body(result)
+        etag = f'"{last_id}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        with self.lock:
+            if last_id == self.last_id:  # not outdated while querying
+                self.cache[key] = (etag, body)
+                while len(self.cache) > API_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+        return 200, etag, body
+
+    def params(self, path: str, query: dict) -> dict:
+        """Get the known query parameters of path, normalized.
+
+        Unknown parameters are ignored, so they cannot add cache entries.
+        Raises KeyError for unknown paths and ValueError for bad values.
+
+        """
+        if path == "/products":
+            return {}
+        if path in ("/changes", "/movers"):
+            return {"since": float(query.get("since", 0))}
+        if path == "/history":
+            if "url" not in query:
+                raise ValueError("missing query parameter: url")
+            points = int(query.get("points", API_HISTORY_POINTS))
+            if not 0 < points <= API_MAX_HISTORY_POINTS:
+                raise ValueError(
+                    f"points must be between 1 and {API_MAX_HISTORY_POINTS}"
+                )
+            return {"url": query["url"], "points": points}
+        raise KeyError(path)
+
+    def query(self, db: ProductDatabase, path: str, params: dict):
+        """Run the database queries for path with params from params()."""
+        if path == "/products":
+            return [
+                {
+                    "url": url,
+                    "price": price,
+                    "unix": unix,
+                    "id": row_id,
+                    "delta": delta,
+                }
+                for url, price, unix, row_id, delta in db.get_latest_prices()
+            ]
+        if path == "/changes":
+            return [
+                {
+                    "url": url,
+                    "price": price,
+                    "unix": unix,
+                    "id": row_id,
+                    "delta": delta,
+                }
+                for row_id, url, unix, price, delta in db.get_changes_since(
+                    params["since"]
+                )
+            ]
+        if path == "/movers":
+            return [
+                {"url": url, "price": price, "unix": unix, "delta": delta}
+                for url, unix, price, delta in db.get_movers_since(
+                    params["since"]
+                )
+            ]
+        if path == "/history":
+            if not db.value_already_exists(params["url"]):
+                raise KeyError(params["url"])
+            history = db.get_downsampled_history(
+                params["url"], params["points"]
+            )
+            return {
+                "url": params["url"],
+                "history": [
+                    {"unix": unix, "price": price} for unix, price in history
+                ],
+            }
+        raise KeyError(path)
+
+
+################################################################
+# Class ThreadPoolHTTPServer
+################################################################
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTP server handling requests on a fixed set of worker threads.
+
+    Unlike ThreadingHTTPServer no thread is started per request, so each
+    worker keeps its ProductDatabase read connection between requests.
+    """
+
+    def __init__(self, server_address: tuple, handler, threads: int):
+        """Initialize the class methods and instance variables.
+
+        Arguments:
+        ---------
+            server_address: tuple -- (host, port) to listen on
+            handler: type -- BaseHTTPRequestHandler subclass
+            threads: int -- number of worker threads
+
+        """
+        super(ThreadPoolHTTPServer, self).__init__(server_address, handler)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="api"
+        )
+
+    def process_request(self, request, client_address):
+        """Handle the request on a worker thread."""
+        self.executor.submit(
+            self.process_request_thread, request, client_address
+        )
+
+    def process_request_thread(self, request, client_address):
+        """Handle the request and close it, as HTTPServer would."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """Close the socket and wait for the worker threads."""
+        super(ThreadPoolHTTPServer, self).server_close()
+        self.executor.shutdown(wait=True)
+
+
+################################################################
+# Class ProductApiHandler
+################################################################
+
+
+class ProductApiHandler(BaseHTTPRequestHandler):
+    """Serve ProductApi responses over HTTP, with ETag support."""
+
+    api = None  # ProductApi, set by serve()
+
+    def do_GET(self):  # noqa: N802, name required by BaseHTTPRequestHandler
+        """Handle a GET request."""
+        parsed = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        status, etag, body = self.api.get(parsed.path.rstrip("/"), query)
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        """Log requests via logging instead of stderr."""
+        logging.debug(f"ProductApiHandler:: {format % args}")
+
 
 ################################################################
 # Regular functions
 ################################################################
 
 
-def which_is_more_expensive(price1: str, price2: str) -> int:
-    """Determine which price is higher."""
-    if price1 > price2:
-        return 1  # If price1 is bigger return 1
-    elif price1 < price2:
-        return -1  # If price2 is bigger return -1
+def json_body(data) -> bytes:
+    """Encode data as compact JSON bytes."""
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def delta_direction(delta: float) -> int:
+    """Determine if the price went up (1), down (-1) or stayed (0)."""
+    if delta is None:
+        return 0  # first or failed sample
+    if delta > 0:
+        return 1
+    elif delta < 0:
+        return -1
     return 0
 
 
+def execute_write(
+    connection: sqlite3.Connection, sql: str, params, many: bool
+) -> tuple:
+    """Execute one write on the writer connection.
+
+    sql may also be a list of (sql, params) statements, which are
+    executed in order.
+
+    Returns
+    -------
+        tuple -- (changed rows, id of the last inserted row)
+
+    """
+    if isinstance(sql, list):
+        for statement, statement_params in sql:
+            result = execute_write(
+                connection, statement, statement_params, many
+            )
+        return result
+    if many:
+        cursor = connection.executemany(sql, params)
+    else:
+        cursor = connection.execute(sql, params)
+    return cursor.rowcount, cursor.lastrowid
+
+
+def columnar_format(file_path: str) -> str:
+    """Determine the columnar file format from the file name.
+
+    Arguments:
+    ---------
+        file_path:str -- path and name of a *.parquet or *.npz file
+    Returns:
+    -------
+        str -- "parquet" or "npz"
+
+    """
+    if file_path.endswith(".parquet"):
+        if pq is None:
+            raise ValueError("Parquet files require pyarrow to be installed.")
+        return "parquet"
+    if file_path.endswith(".npz"):
+        if np is None:
+            raise ValueError("npz files require numpy to be installed.")
+        return "npz"
+    raise ValueError(f"Unknown columnar file type: {file_path}")
+
+
+def default_export_suffix() -> str:
+    """Get the preferred export file suffix: Parquet if pyarrow exists."""
+    return ".parquet" if pq is not None else ".npz"
+
+
+def price_to_float(price) -> float:
+    """Convert a stored price to float, NaN if it is not a number."""
+    try:
+        return float(price)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def write_parquet_chunks(file_path: str, chunks, since_id: int) -> int:
+    """Write row chunks to a Parquet file, return the largest id."""
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("url", pa.string()),
+            ("price", pa.float64()),
+            ("datestamp", pa.string()),
+            ("unix", pa.float64()),
+        ]
+    )
+    watermark = since_id
+    with pq.ParquetWriter(file_path, schema, compression="zstd") as writer:
+        for rows in chunks:
+            ids, urls, prices, dates, unixes = zip(*rows)
+            table = pa.table(
+                [
+                    pa.array(ids, pa.int64()),
+                    pa.array(urls, pa.string()),
+                    pa.array(map(price_to_float, prices), pa.float64()),
+                    pa.array(dates, pa.string()),
+                    pa.array(unixes, pa.float64()),
+                ],
+                schema=schema,
+            )
+            writer.write_table(table)
+            watermark = ids[-1]
+    return watermark
+
+
+def read_parquet_chunks(file_path: str, chunk_size: int):
+    """Yield rows of (id, url, price, datestamp, unix) from Parquet."""
+    parquet_file = pq.ParquetFile(file_path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        columns = batch.to_pydict()
+        yield list(
+            zip(
+                columns["id"],
+                columns["url"],
+                columns["price"],
+                columns["datestamp"],
+                columns["unix"],
+            )
+        )
+
+
+def write_npz_chunks(file_path: str, chunks, since_id: int) -> int:
+    """Write row chunks to a compressed npz file, return the largest id.
+
+    Every chunk is stored as its own set of arrays (id_0, url_0, ...), so
+    only one chunk is ever held in memory, both here and when reading.
+
+    """
+    watermark = since_id
+    with zipfile.ZipFile(file_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index, rows in enumerate(chunks):
+            ids, urls, prices, dates, unixes = zip(*rows)
+            columns = {
+                "id": np.array(ids, dtype=np.int64),
+                "url": np.array(urls, dtype=str),
+                "price": np.array(
+                    [price_to_float(p) for p in prices], dtype=np.float64
+                ),
+                "datestamp": np.array(dates, dtype=str),
+                "unix": np.array(unixes, dtype=np.float64),
+            }
+            for name, array in columns.items():
+                with archive.open(
+                    f"{name}_{index}.npy", "w", force_zip64=True
+                ) as member:
+                    np.lib.format.write_array(member, array)
+            watermark = ids[-1]
+    return watermark
+
+
+def read_npz_chunks(file_path: str):
+    """Yield rows of (id, url, price, datestamp, unix) from npz."""
+    with np.load(file_path) as archive:
+        index = 0
+        while f"id_{index}" in archive.files:
+            yield list(
+                zip(
+                    archive[f"id_{index}"].tolist(),
+                    archive[f"url_{index}"].tolist(),
+                    archive[f"price_{index}"].tolist(),
+                    archive[f"datestamp_{index}"].tolist(),
+                    archive[f"unix_{index}"].tolist(),
+                )
+            )
+            index += 1
+
+
+def simulate_refresh_policy(
+    history, budget_per_day: float, adaptive: bool, step: float
+) -> dict:
+    """Replay a stored price history against a refresh policy.
+
+    A check at time t sees the last stored price at or before t. The
+    scheduler starts without knowledge and only learns from its own
+    checks, as it would in production.
+
+    Arguments:
+    ---------
+        history: dict -- url -> (unixtimes, prices), e.g. array('d')s
+        budget_per_day: float -- scrapes per day for all products
+        adaptive: bool -- use volatility based intervals
+        step: float -- seconds between two scheduling rounds
+    Returns:
+    -------
+        dict -- number of scrapes, caught changes and stored changes
+
+    """
+    scheduler = RefreshScheduler(
+        budget_per_day, min_interval=step, adaptive=adaptive
+    )
+    start = min(times[0] for times, _ in history.values())
+    end = max(times[-1] for times, _ in history.values())
+    for url, (times, prices) in history.items():
+        scheduler.add(url, times[0])
+        scheduler.record(url, times[0], prices[0])
+    scrapes = 0
+    caught = 0
+    tokens = 0.0  # global budget, refilled every step
+    now = start
+    while now <= end:
+        tokens = min(
+            tokens + budget_per_day * step / SECONDS_PER_DAY, budget_per_day
+        )
+        for url in scheduler.due(now, int(tokens)):
+            times, prices = history[url]
+            price = prices[bisect.bisect_right(times, now) - 1]
+            caught += scheduler.record(url, now, price)
+            scrapes += 1
+            tokens -= 1
+        now += step
+    changes = sum(
+        sum(a != b for a, b in zip(prices, prices[1:]))
+        for _, prices in history.values()
+    )
+    return {"scrapes": scrapes, "caught": caught, "changes": changes}
+
+
 def copy_link_to_clipboard(url: str):
     """Copy URL to system clipboard."""
     pyperclip.copy(url)
@@ -538,7 +2245,7 @@ def get_price(args: argparse.Namespace, url: str) -> str:
         )
         return random_price
     try:
-        sauce = urllib.request.urlopen(url)
+        sauce = args.fetcher.fetch(url)
         soup = bs.BeautifulSoup(sauce, "lxml")
         try:
             search = soup.find("span", {"id": "priceblock_dealprice"})
@@ -569,19 +2276,22 @@ def get_price(args: argparse.Namespace, url: str) -> str:
     return tag
 
 
-def get_product_name(url: str) -> str:
+def get_product_name(url: str, fetcher=None) -> str:
     """Get the product name for a given URL via web scraping.
 
     Arguments:
     ---------
         url:str -- Amazon product URL
+        fetcher -- fetch backend, LiveFetch if None
     Returns:
     -------
         str -- product name
 
     """
+    if fetcher is None:
+        fetcher = LiveFetch()
     try:
-        sauce = urllib.request.urlopen(url)
+        sauce = fetcher.fetch(url)
         soup = bs.BeautifulSoup(sauce, "lxml")
         search = soup.find("span", {"id": "productTitle"})
         tag = search.text
@@ -647,6 +2357,81 @@ def init_args() -> argparse.Namespace:
         help="Path and name of sqlite3 database file. "
         f"Default is {DEFAULT_DB_FILENAME}.",
     )
+    parser.add_argument(
+        "--export",
+        default=None,
+        metavar="FILE",
+        help="Export price history to FILE (*.parquet or *.npz) and exit. "
+        "Without a suffix Parquet is used if pyarrow is installed, "
+        "npz otherwise.",
+    )
+    parser.add_argument(
+        "--export-since",
+        type=int,
+        default=0,
+        metavar="ID",
+        help="Only export rows with an id larger than ID (watermark). "
+        "Default is 0, i.e. everything.",
+    )
+    parser.add_argument(
+        "--record",
+        default=None,
+        metavar="FILE",
+        help="Record all scraped pages to the gzip archive FILE "
+        "(appended if it exists).",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        metavar="FILE",
+        help="Serve scraped pages from the archive FILE made by --record "
+        "instead of the web.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        metavar="X",
+        help="Replay recorded fetch durations X times faster, "
+        "0 for no delays. Default is 1.0.",
+    )
+    parser.add_argument(
+        "--refresh-budget",
+        type=int,
+        default=REFRESH_BUDGET_PER_DAY,
+        metavar="N",
+        help="Scrape at most N prices per day. Volatile products are "
+        "checked more often than stable ones. "
+        f"Default is {REFRESH_BUDGET_PER_DAY}.",
+    )
+    parser.add_argument(
+        "--simulate",
+        default=False,
+        action="store_true",
+        help="Replay the stored history with a uniform and a volatility "
+        "based refresh policy under --refresh-budget, print the results "
+        "and exit.",
+    )
+    parser.add_argument(
+        "--serve",
+        type=int,
+        default=None,
+        metavar="PORT",
+        help="Serve products, prices and history as read-only JSON "
+        "on PORT instead of showing the GUI.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address for --serve to listen on. Default is 127.0.0.1.",
+    )
+    parser.add_argument(
+        "--import",
+        dest="import_file",
+        default=None,
+        metavar="FILE",
+        help="Import price history from FILE (*.parquet or *.npz) and exit.",
+    )
     args = parser.parse_args()
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
@@ -671,6 +2456,7 @@ def init() -> argparse.Namespace:
     # arguments
     args = init_args()
     args.database.close()  # the file is opened by default by argparse
+    args.fetcher = init_fetcher(args)
     # matplotlib
     # plot has a lot of DEBUG logging which we do not want to see
     # so we raise log level to INFO
@@ -680,6 +2466,28 @@ def init() -> argparse.Namespace:
     return args
 
 
+def init_fetcher(args: argparse.Namespace):
+    """Create the fetch backend selected by the arguments.
+
+    Arguments:
+    ---------
+        args:argparse.Namespace -- namespace with all arguments from argparse
+    Returns:
+    -------
+        LiveFetch, RecordFetch or ReplayFetch -- fetch backend
+
+    """
+    if args.replay:
+        fetcher = ReplayFetch(args.replay, args.replay_speed)
+    else:
+        fetcher = LiveFetch()
+    if args.record:
+        # recording a replay is allowed, e.g. to cut down an archive
+        fetcher = RecordFetch(args.record, fetcher)
+    logging.debug(f"init_fetcher:: using {type(fetcher).__name__}.")
+    return fetcher
+
+
 def window(args: argparse.Namespace, db: ProductDatabase) -> int:
     """Create the window and go into event loop.
 
@@ -696,26 +2504,131 @@ def window(args: argparse.Namespace, db: ProductDatabase) -> int:
     win = ProductWindow(args, db)
     win.show()
     ret = app.exec()  # enter event loop
+    win.scraper.shutdown(cancel_futures=True)  # before the db is closed
     return ret
 
 
+def transfer(args: argparse.Namespace, db: ProductDatabase) -> int:
+    """Export and/or import price history instead of showing the GUI.
+
+    Arguments:
+    ---------
+        args:argparse.Namespace -- namespace with all arguments from argparse
+        db: ProductDatabase -- sqlite3 database object
+    Returns:
+    -------
+        int -- return code
+
+    """
+    try:
+        if args.import_file:
+            db.import_history(args.import_file)
+        if args.export:
+            export_file = args.export
+            if not export_file.endswith((".parquet", ".npz")):
+                export_file += default_export_suffix()
+            watermark = db.export_history(export_file, args.export_since)
+            # print the watermark so that jobs can pass it to --export-since
+            print(watermark)
+    except ValueError as e:
+        logging.error(f"transfer:: {e}")
+        return 1
+    return 0
+
+
+def serve(args: argparse.Namespace, db: ProductDatabase) -> int:
+    """Serve the read-only HTTP/JSON API until interrupted.
+
+    GET /products -- latest price of each product
+    GET /history?url=URL&points=N -- downsampled price history of URL
+    GET /changes?since=UNIX -- every price change after UNIX
+    GET /movers?since=UNIX -- last change of products changed after UNIX
+
+    Arguments:
+    ---------
+        args:argparse.Namespace -- namespace with all arguments from argparse
+        db: ProductDatabase -- sqlite3 database object
+    Returns:
+    -------
+        int -- return code
+
+    """
+    ProductApiHandler.api = ProductApi(db)
+    server = ThreadPoolHTTPServer(
+        (args.host, args.serve), ProductApiHandler, API_THREADS
+    )
+    logging.info(f"serve:: listening on http://{args.host}:{args.serve}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.debug("serve:: received keyboard interrupt.")
+    finally:
+        server.server_close()
+    return 0
+
+
+def simulate(args: argparse.Namespace, db: ProductDatabase) -> int:
+    """Compare refresh policies on the stored history and print results.
+
+    Arguments:
+    ---------
+        args:argparse.Namespace -- namespace with all arguments from argparse
+        db: ProductDatabase -- sqlite3 database object
+    Returns:
+    -------
+        int -- return code
+
+    """
+    history = {}
+    for url, unix, price in db.iter_price_history():
+        times, prices = history.setdefault(url, (array("d"), array("d")))
+        times.append(unix)
+        prices.append(price)
+    if not history:
+        logging.error("simulate:: no price history to replay.")
+        return 1
+    for name, adaptive in (("uniform", False), ("volatility", True)):
+        result = simulate_refresh_policy(
+            history, args.refresh_budget, adaptive, MIN_REFRESH_INTERVAL
+        )
+        print(
+            f"{name}: {result['scrapes']} scrapes caught "
+            f"{result['caught']} of {result['changes']} stored changes"
+        )
+    return 0
+
+
 def main():
     """Track Amazon prices."""
     args = init()
-    db = ProductDatabase(args, args.database.name)
-    ret = window(args, db)
-    db.close()
+    # the API only reads, it neither migrates nor writes the database
+    db = ProductDatabase(
+        args, args.database.name, read_only=args.serve is not None
+    )
+    try:
+        if args.export or args.import_file:
+            ret = transfer(args, db)
+        elif args.simulate:
+            ret = simulate(args, db)
+        elif args.serve is not None:
+            ret = serve(args, db)
+        else:
+            ret = window(args, db)
+    finally:
+        db.close()
+        args.fetcher.close()
     logging.debug(f"main:: exiting with code {ret}.")
     sys.exit(ret)
 
 
-try:
-    main()
-except KeyboardInterrupt:
-    logging.debug("Received keyboard interrupt.")
-    raise
-    sys.exit()
-except Exception as e:
-    logging.error(f"Caught exception {e}.")
-    raise
-    sys.exit()
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logging.debug("Received keyboard interrupt.")
+        raise
+        sys.exit()
+    except Exception as e:
+        logging.error(f"Caught exception {e}.")
+        raise
+        sys.exit()
@@ -0,0 +1,74 @@
+"""Shared fixtures for the amazon price tracker tests."""
+
+import argparse
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # no display needed
+
+import amazon  # noqa: E402
+
+
+class PriceFetch:
+    """Fetch backend serving a product page with a set price per URL.
+
+    URLs without a price fail like an unreachable Amazon.
+
+    """
+
+    def __init__(self, prices=None):
+        self.prices = dict(prices or {})
+
+    def fetch(self, url):
+        if url not in self.prices:
+            raise amazon.urllib.request.URLError("no route")
+        return (
+            f'<span id="priceblock_ourprice">${self.prices[url]}</span>'
+        ).encode()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Yield a new, empty ProductDatabase, closed afterwards."""
+    database = amazon.ProductDatabase(None, str(tmp_path / "amazon.db"))
+    yield database
+    database.close()
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    """Yield the QApplication the windows of all tests share."""
+    yield amazon.QApplication.instance() or amazon.QApplication([])
+
+
+@pytest.fixture
+def make_window(qapp, db):
+    """Yield a function creating a ProductWindow on db, closed afterwards.
+
+    URLs like https://host/name are shown as name, without fetching the
+    product name.
+
+    """
+    windows = []
+
+    def make(fetcher=None, refresh_budget=amazon.REFRESH_BUDGET_PER_DAY):
+        args = argparse.Namespace(
+            fake_prices=False,
+            fetcher=fetcher or PriceFetch(),
+            refresh_budget=refresh_budget,
+        )
+        window = amazon.ProductWindow(args, db)
+        windows.append(window)
+        return window
+
+    yield make
+    for window in windows:
+        window.refresh_timer.stop()
+        window.scraper.shutdown(cancel_futures=True)
+        window.close()
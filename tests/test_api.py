@@ -0,0 +1,108 @@
+"""Tests for the read-only JSON API of the amazon price tracker."""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import amazon
+
+
+def test_products_show_the_latest_valid_price(db):
+    db.add_item_to_db("a", 10)
+    db.add_item_to_db("a", 12)
+    db.add_item_to_db("a", -1)
+    db.add_item_to_db("a", "Not available")
+    db.add_item_to_db("b", -1)
+    assert [row[:2] for row in db.get_latest_prices()] == [("a", 12.0)]
+    status, _, body = amazon.ProductApi(db).get("/products", {})
+    assert status == 200
+    assert [(row["url"], row["price"]) for row in json.loads(body)] == [
+        ("a", 12.0)
+    ]
+
+
+def counting_api(db):
+    """Get a ProductApi on db and a list counting its queries."""
+    api = amazon.ProductApi(db)
+    queries = []
+    query = api.query
+
+    def counting_query(db, path, params):
+        queries.append(path)
+        return query(db, path, params)
+
+    api.query = counting_query
+    return api, queries
+
+
+def test_responses_are_cached_until_the_data_changes(db):
+    db.add_item_to_db("a", 10)
+    db.add_item_to_db("b", 20)
+    api, queries = counting_api(db)
+    first = api.get("/movers", {"since": "0"})
+    assert api.get("/movers", {"since": "0.0", "unknown": "1"}) == first
+    assert len(queries) == 1
+    db.add_item_to_db("a", 11)  # new last id
+    assert api.get("/movers", {"since": "0"}) != first
+    assert len(queries) == 2
+    products = api.get("/products", {})
+    db.delete_rows_for_url("b")  # same last id, new data_version
+    assert api.get("/products", {}) != products
+    assert len(queries) == 4
+
+
+def test_cache_keeps_the_most_recently_used_responses(db, monkeypatch):
+    monkeypatch.setattr(amazon, "API_CACHE_SIZE", 2)
+    db.add_item_to_db("a", 10)
+    api, queries = counting_api(db)
+    for since in ("1", "2", "1", "3", "1", "2"):
+        api.get("/changes", {"since": since})
+    assert queries == ["/changes"] * 4  # 2 was evicted by 3
+    assert len(api.cache) == 2
+
+
+def test_bad_requests_are_rejected(db):
+    db.add_item_to_db("a", 10)
+    api = amazon.ProductApi(db)
+    for path, query, status in [
+        ("/nothing", {}, 404),
+        ("/history", {}, 400),
+        ("/history", {"url": "b"}, 404),
+        ("/history", {"url": "a", "points": "0"}, 400),
+        ("/history", {"url": "a", "points": "many"}, 400),
+        ("/changes", {"since": "yesterday"}, 400),
+    ]:
+        response_status, etag, body = api.get(path, query)
+        assert (response_status, etag) == (status, None)
+        assert "error" in json.loads(body)
+    assert api.cache == {}
+
+
+def test_http_responses_support_etags(db):
+    db.add_item_to_db("a", 10)
+    amazon.ProductApiHandler.api = amazon.ProductApi(db)
+    server = amazon.ThreadPoolHTTPServer(
+        ("127.0.0.1", 0), amazon.ProductApiHandler, 2
+    )
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/products"
+    try:
+        with urllib.request.urlopen(url) as response:
+            etag = response.headers["ETag"]
+            assert json.loads(response.read())[0]["price"] == 10.0
+        request = urllib.request.Request(url, headers={"If-None-Match": etag})
+        with pytest.raises(urllib.error.HTTPError) as not_modified:
+            urllib.request.urlopen(request)
+        assert not_modified.value.code == 304
+        db.add_item_to_db("a", 12)
+        with urllib.request.urlopen(request) as response:
+            assert response.headers["ETag"] != etag
+            assert json.loads(response.read())[0]["price"] == 12.0
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,105 @@
+"""Tests for the ProductDatabase writer thread."""
+
+import sqlite3
+import threading
+
+import pytest
+
+import amazon
+
+
+def test_queued_writes_are_committed_in_batches(db):
+    batch_sizes = []
+    write_batch = db.write_batch
+
+    def recording_write_batch(connection, batch):
+        batch_sizes.append(len(batch))
+        write_batch(connection, batch)
+
+    db.write_batch = recording_write_batch
+    # keep the writer waiting for the lock while writes pile up
+    blocker = sqlite3.connect(db.db_file_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    first = db.write("SELECT 1", wait=False)
+    for price in range(50):
+        db.add_item_to_db("url", price, wait=False)
+    blocker.execute("COMMIT")
+    blocker.close()
+    first.result(timeout=10)
+    db.flush()
+    assert db.get_row_count() == 50
+    assert max(batch_sizes) > 1
+
+
+def test_failed_write_only_fails_its_own_future(db):
+    bad = db.write(
+        "INSERT INTO amazon (url, price) VALUES (?, ?)",
+        ("url", 10**20),
+        wait=False,
+    )
+    good = db.write(
+        "INSERT INTO amazon (url, price) VALUES (?, ?)", ("url", 5), wait=False
+    )
+    with pytest.raises(OverflowError):
+        bad.result(timeout=10)
+    assert good.result(timeout=10)[0] == 1
+    with pytest.raises(sqlite3.OperationalError):
+        db.write("INSERT INTO nothing VALUES (1)")
+    db.add_item_to_db("url", 6)  # the writer is still alive
+    assert db.get_row_count() == 2
+
+
+def test_write_after_close_raises(tmp_path):
+    database = amazon.ProductDatabase(None, str(tmp_path / "amazon.db"))
+    database.close()
+    with pytest.raises(sqlite3.OperationalError):
+        database.write("SELECT 1")
+
+
+def test_writes_racing_close_never_hang(tmp_path):
+    database = amazon.ProductDatabase(None, str(tmp_path / "amazon.db"))
+    futures = []
+
+    def write_until_closed():
+        while True:
+            try:
+                futures.append(database.write("SELECT 1", wait=False))
+            except sqlite3.OperationalError:
+                return
+
+    writers = [threading.Thread(target=write_until_closed) for _ in range(4)]
+    for thread in writers:
+        thread.start()
+    database.close()
+    for thread in writers:
+        thread.join(timeout=10)
+    for future in futures:
+        future.exception(timeout=10)  # raises TimeoutError if never done
+
+
+def test_locked_database_fails_open_instead_of_hanging(tmp_path, monkeypatch):
+    monkeypatch.setattr(amazon, "DB_BUSY_TIMEOUT", 0.1)
+    path = str(tmp_path / "amazon.db")
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN EXCLUSIVE")
+    with pytest.raises(sqlite3.OperationalError):
+        amazon.ProductDatabase(None, path)
+    blocker.execute("ROLLBACK")
+    blocker.close()
+    database = amazon.ProductDatabase(None, path)
+    database.add_item_to_db("url", 5)
+    assert database.get_row_count() == 1
+    database.close()
+
+
+def test_close_leaves_everything_in_the_database_file(tmp_path):
+    path = tmp_path / "amazon.db"
+    database = amazon.ProductDatabase(None, str(path))
+    database.add_item_to_db("url", 5)
+    database.get_latest_prices()  # open a reader connection
+    database.close()
+    assert not (tmp_path / "amazon.db-wal").exists()
+    assert (
+        sqlite3.connect(path).execute("SELECT COUNT(*) FROM amazon").fetchone()
+        == (1,)
+    )
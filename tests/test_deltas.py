@@ -0,0 +1,122 @@
+"""Tests for the delta and changed columns of the price history."""
+
+import sqlite3
+
+import pytest
+
+import amazon
+
+
+def create_old_database(path):
+    """Create a database from before the delta and changed columns."""
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE amazon(url TEXT, price REAL, "
+        "datestamp TEXT, unix REAL, id INTEGER PRIMARY KEY AUTOINCREMENT)"
+    )
+    connection.executemany(
+        "INSERT INTO amazon (url, price, unix) VALUES (?, ?, ?)",
+        [
+            ("a", 10, 1),
+            ("b", 3, 2),
+            ("a", 10, 3),
+            ("a", -1, 4),
+            ("a", "Not available", 5),
+            ("a", 12, 6),
+            ("b", 2, 7),
+        ],
+    )
+    connection.commit()
+    connection.close()
+
+
+EXPECTED_DELTAS = [
+    ("a", None, 0),
+    ("b", None, 0),
+    ("a", 0.0, 0),
+    ("a", None, 0),
+    ("a", None, 0),
+    ("a", 2.0, 1),
+    ("b", -1.0, 1),
+]
+
+
+def test_old_database_is_migrated_and_backfilled(tmp_path):
+    path = str(tmp_path / "amazon.db")
+    create_old_database(path)
+    database = amazon.ProductDatabase(None, path)
+    rows = database.connection.execute(
+        "SELECT url, delta, changed FROM amazon ORDER BY id"
+    ).fetchall()
+    assert rows == EXPECTED_DELTAS
+    assert [row[1] for row in database.get_changes_since(0)] == ["a", "b"]
+    database.add_item_to_db("a", 11)
+    assert database.get_latest_prices()[-1][4] == -1.0
+    database.close()
+
+
+def test_failed_migration_leaves_the_table_unchanged(tmp_path, monkeypatch):
+    path = str(tmp_path / "amazon.db")
+    create_old_database(path)
+    monkeypatch.setattr(
+        amazon.ProductDatabase,
+        "update_deltas_statement",
+        lambda self, urls=None: ("UPDATE nothing SET delta = 1", ()),
+    )
+    with pytest.raises(sqlite3.OperationalError):
+        amazon.ProductDatabase(None, path)
+    columns = sqlite3.connect(path).execute("PRAGMA table_info(amazon)")
+    assert "delta" not in [row[1] for row in columns]
+    monkeypatch.undo()
+    database = amazon.ProductDatabase(None, path)
+    rows = database.connection.execute(
+        "SELECT url, delta, changed FROM amazon ORDER BY id"
+    ).fetchall()
+    assert rows == EXPECTED_DELTAS
+    database.close()
+
+
+def test_half_migrated_database_is_completed(tmp_path):
+    path = str(tmp_path / "amazon.db")
+    create_old_database(path)
+    connection = sqlite3.connect(path)
+    connection.execute("ALTER TABLE amazon ADD COLUMN delta REAL")
+    connection.close()
+    database = amazon.ProductDatabase(None, path)
+    rows = database.connection.execute(
+        "SELECT url, delta, changed FROM amazon ORDER BY id"
+    ).fetchall()
+    assert rows == EXPECTED_DELTAS
+    database.close()
+
+
+def test_old_database_read_only_computes_deltas(tmp_path):
+    path = str(tmp_path / "amazon.db")
+    create_old_database(path)
+    database = amazon.ProductDatabase(None, path, read_only=True)
+    assert [row[4] for row in database.get_changes_since(0)] == [2.0, -1.0]
+    assert sorted(row[0] for row in database.get_movers_since(0)) == [
+        "a",
+        "b",
+    ]
+    database.close()
+    columns = sqlite3.connect(path).execute("PRAGMA table_info(amazon)")
+    assert "delta" not in [row[1] for row in columns]
+
+
+def test_update_deltas_for_some_urls(db):
+    for price in (1, 2, 2, 5):
+        db.add_item_to_db("a", price)
+        db.add_item_to_db("b", price)
+    db.write("UPDATE amazon SET delta = 99, changed = 1")
+    db.update_deltas(["a"])
+    rows = db.connection.execute(
+        "SELECT url, delta, changed FROM amazon ORDER BY url, id"
+    ).fetchall()
+    assert rows[:4] == [
+        ("a", None, 0),
+        ("a", 1.0, 1),
+        ("a", 0.0, 0),
+        ("a", 3.0, 1),
+    ]
+    assert all(row[1:] == (99.0, 1) for row in rows[4:])
@@ -0,0 +1,60 @@
+"""Tests for the columnar export and import of the price history."""
+
+import pytest
+
+import amazon
+
+
+@pytest.mark.parametrize("suffix", [".npz", ".parquet"])
+def test_export_import_round_trip_with_watermark(db, tmp_path, suffix):
+    pytest.importorskip("numpy" if suffix == ".npz" else "pyarrow")
+    for price in range(20):
+        db.add_item_to_db(f"url{price % 3}", price)
+    watermark = db.export_history(str(tmp_path / f"all{suffix}"), chunk_size=7)
+    assert watermark == 20
+    db.add_item_to_db("url0", 100)
+    newer = str(tmp_path / f"newer{suffix}")
+    assert db.export_history(newer, since_id=watermark, chunk_size=7) == 21
+
+    copy = amazon.ProductDatabase(None, str(tmp_path / "copy.db"))
+    assert copy.import_history(str(tmp_path / f"all{suffix}"), 5) == 20
+    assert copy.import_history(str(tmp_path / f"all{suffix}")) == 0
+    assert copy.import_history(newer) == 1
+    columns = "url, price, datestamp, unix, delta, changed"
+    query = f"SELECT {columns} FROM amazon ORDER BY unix"
+    assert (
+        copy.connection.execute(query).fetchall()
+        == db.connection.execute(query).fetchall()
+    )
+    copy.close()
+
+
+def test_import_keeps_rows_with_ids_used_locally(db, tmp_path):
+    pytest.importorskip("numpy")
+    other = amazon.ProductDatabase(None, str(tmp_path / "other.db"))
+    other.add_item_to_db("other", 1)
+    other.export_history(str(tmp_path / "other.npz"))
+    other.close()
+    db.add_item_to_db("local", 2)  # same id as the exported row
+    assert db.import_history(str(tmp_path / "other.npz")) == 1
+    assert db.get_row_count() == 2
+
+
+def test_import_counts_only_its_own_rows(db, tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    for price in range(10):
+        db.add_item_to_db("url", price)
+    db.export_history(str(tmp_path / "all.npz"))
+    copy = amazon.ProductDatabase(None, str(tmp_path / "copy.db"))
+    copy.add_item_to_db("url", 0)  # not the same unixtime, imported too
+    read_npz_chunks = amazon.read_npz_chunks
+
+    def read_with_concurrent_writes(file_path):
+        for rows in read_npz_chunks(file_path):
+            yield rows
+            copy.add_item_to_db("other", 1)  # e.g. by the scraper
+
+    monkeypatch.setattr(amazon, "read_npz_chunks", read_with_concurrent_writes)
+    assert copy.import_history(str(tmp_path / "all.npz")) == 10
+    assert copy.get_row_count() == 12
+    copy.close()
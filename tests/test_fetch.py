@@ -0,0 +1,91 @@
+"""Tests for recording and replaying fetches."""
+
+import gzip
+import tracemalloc
+import urllib.request
+
+import pytest
+
+import amazon
+
+
+class FakeFetch:
+    """Fetch backend serving numbered pages, or errors for some URLs."""
+
+    def __init__(self):
+        self.count = 0
+
+    def fetch(self, url):
+        self.count += 1
+        if url == "http-error":
+            raise urllib.request.HTTPError(url, 503, "Unavailable", None, None)
+        if url == "url-error":
+            raise urllib.request.URLError("no route")
+        return f"{url} {self.count}".encode()
+
+    def close(self):
+        pass
+
+
+def fetch_all(fetcher, urls):
+    """Fetch urls, returning pages or (exception type, text)."""
+    results = []
+    for url in urls:
+        try:
+            results.append(fetcher.fetch(url))
+        except urllib.request.URLError as e:
+            results.append((type(e), str(e)))
+    return results
+
+
+def test_replay_serves_recorded_responses_and_errors(tmp_path):
+    archive = str(tmp_path / "fetch.jsonl.gz")
+    urls = ["page", "page", "http-error", "url-error"]
+    recorder = amazon.RecordFetch(archive, FakeFetch())
+    recorded = fetch_all(recorder, urls)
+    recorder.close()
+    replay = amazon.ReplayFetch(archive, speed=0)
+    assert fetch_all(replay, urls) == recorded
+    assert replay.fetch("page") == b"page 2"  # last response repeats
+    with pytest.raises(urllib.request.URLError):
+        replay.fetch("unknown")
+
+
+def test_replay_loads_archive_of_killed_recording(tmp_path):
+    archive = tmp_path / "fetch.jsonl.gz"
+    recorder = amazon.RecordFetch(str(archive), FakeFetch())
+    recorder.fetch("first")
+    recorder.fetch("second")  # no close(), as if killed
+    truncated = tmp_path / "truncated.jsonl.gz"
+    truncated.write_bytes(archive.read_bytes()[:-10])
+    assert amazon.ReplayFetch(str(archive), 0).fetch("second") == b"second 2"
+    replay = amazon.ReplayFetch(str(truncated), 0)
+    assert replay.fetch("first") == b"first 1"
+    assert "second" not in replay.responses
+    with gzip.open(archive, "rt") as lines:
+        assert len(lines.readlines()) == 2
+
+
+class BigFetch:
+    """Fetch backend serving large, distinct pages."""
+
+    def fetch(self, url):
+        return url.encode() * (2**20 // len(url))
+
+    def close(self):
+        pass
+
+
+def test_replay_does_not_keep_responses_in_memory(tmp_path):
+    archive = str(tmp_path / "fetch.jsonl.gz")
+    recorder = amazon.RecordFetch(archive, BigFetch())
+    urls = [f"page{number}" for number in range(10)]
+    fetch_all(recorder, urls + urls)
+    recorder.close()
+    tracemalloc.start()
+    replay = amazon.ReplayFetch(archive, speed=0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 10 * 2**20  # a few records, not all 27 MB of them
+    assert fetch_all(replay, urls) == [BigFetch().fetch(url) for url in urls]
+    replay.close()
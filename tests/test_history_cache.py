@@ -0,0 +1,89 @@
+"""Tests for the in-process price history cache."""
+
+import math
+import sqlite3
+import threading
+
+
+def test_writer_never_waits_for_the_cache_lock(db):
+    db.add_item_to_db("url", 1)
+    db.history.get("url")
+    with db.history.lock:  # e.g. a slow load in another thread
+        writes = threading.Thread(
+            target=lambda: [db.add_item_to_db("url", p) for p in (2, 3)]
+        )
+        writes.start()
+        writes.join(timeout=10)
+        assert not writes.is_alive()
+    assert list(db.history.get("url").prices) == [1.0, 2.0, 3.0]
+
+
+def test_commits_while_loading_are_not_lost(db):
+    for price in range(5):
+        db.add_item_to_db("url", price)
+    load = db.iter_id_unixtime_price_for_url
+
+    def load_with_commits(url):
+        for index, row in enumerate(load(url)):
+            if index == 2:  # the load does not see these
+                db.add_item_to_db("url", 10)
+                db.add_item_to_db("url", 11)
+            yield row
+
+    db.iter_id_unixtime_price_for_url = load_with_commits
+    series = db.history.get("url")
+    assert list(series.prices) == [0.0, 1.0, 2.0, 3.0, 4.0, 10.0, 11.0]
+    assert series.last_id == db.get_last_id()
+    assert db.history.loading == {}
+
+
+def test_least_recently_used_series_are_evicted(db):
+    for url in ("a", "b", "c"):
+        for price in range(4):
+            db.add_item_to_db(url, price)
+    db.history.max_bytes = 2 * 4 * 16  # two series of four samples
+    db.history.get("a")
+    db.history.get("b")
+    db.history.get("a")
+    db.history.get("c")
+    assert list(db.history.series) == ["a", "c"]
+    assert db.history.nbytes == 2 * 4 * 16
+    db.history.discard("a")
+    assert db.history.nbytes == 4 * 16
+
+
+def test_committed_inserts_are_appended_to_cached_series(db):
+    db.add_item_to_db("a", 1)
+    series = db.history.get("a")
+    db.add_item_to_db("a", 2)
+    db.add_item_to_db("a", "Not available")
+    db.add_item_to_db("b", 3)  # not cached, not loaded
+    assert db.history.get("a") is series
+    assert list(series.prices)[:2] == [1.0, 2.0]
+    assert math.isnan(series.prices[2])
+    assert series.last_id == db.get_last_id() - 1
+    assert list(db.history.series) == ["a"]
+
+
+def test_rows_of_other_processes_are_merged_in_time_order(db):
+    db.add_item_to_db("a", 1)
+    series = db.history.get("a")
+    last_id = db.get_last_id()
+    db.add_item_to_db("a", 3)
+    first, now = [row[1] for row in db.iter_id_unixtime_price_for_url("a")]
+    other = sqlite3.connect(db.db_file_path)  # another process
+    with other:
+        other.execute(
+            "INSERT INTO amazon (url, price, unix) VALUES (?, ?, ?)",
+            ("a", 4, now + 1),
+        )
+        other.execute(
+            "INSERT INTO amazon (url, price, unix) VALUES (?, ?, ?)",
+            ("a", 2, (first + now) / 2),  # older than our own last row
+        )
+    other.close()
+    rows = db.get_rows_since(last_id)
+    db.history.append_rows(rows)
+    assert list(db.history.get("a").prices) == [1.0, 2.0, 3.0, 4.0]
+    db.history.append_rows(rows)  # seen before, no duplicates
+    assert list(db.history.get("a").prices) == [1.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,33 @@
+"""Tests for the product labels of the amazon price tracker window."""
+
+
+def label_texts(window):
+    """Get url -> label text of the window's products."""
+    return {
+        url: label.text()
+        for url, (label, _, _) in window.product_labels.items()
+    }
+
+
+def test_refresh_labels_shows_new_valid_prices(db, make_window):
+    db.add_item_to_db("https://host/a", 10)
+    db.add_item_to_db("https://host/b", 20)
+    window = make_window(refresh_budget=0)  # no scrapes of its own
+    assert label_texts(window) == {
+        "https://host/a": "Product 1: 10.0€\na",
+        "https://host/b": "Product 2: 20.0€\nb",
+    }
+    window.refresh_labels()  # nothing new
+    db.add_item_to_db("https://host/a", 12)
+    db.add_item_to_db("https://host/b", 18)
+    db.add_item_to_db("https://host/b", -1)  # failed, keeps 18
+    db.add_item_to_db("https://host/c", 5)  # e.g. by another process
+    db.add_item_to_db("https://host/c", "Not available")
+    window.refresh_labels()
+    assert label_texts(window) == {
+        "https://host/a": "Product 1: 12.0€\na",
+        "https://host/b": "Product 2: 18.0€\nb",
+        "https://host/c": "Product 3: 5.0€\nc",
+    }
+    assert window.last_id == db.get_last_id()
+    assert list(db.history.get("https://host/a").prices) == [10.0, 12.0]
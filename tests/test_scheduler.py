@@ -0,0 +1,87 @@
+"""Tests for refresh scheduling of the amazon price tracker."""
+
+import threading
+
+from conftest import PriceFetch
+
+import amazon
+
+
+class BlockingFetch(PriceFetch):
+    """PriceFetch that waits until it is released, like a slow Amazon."""
+
+    def __init__(self, prices):
+        super().__init__(prices)
+        self.release = threading.Event()
+
+    def fetch(self, url):
+        assert self.release.wait(10)
+        return super().fetch(url)
+
+
+def test_due_products_are_scraped_off_the_gui_thread(db, make_window):
+    db.add_item_to_db("https://host/ok", 10)
+    db.add_item_to_db("https://host/gone", 20)
+    # last checked long ago, so both are due
+    db.write(
+        "UPDATE amazon SET unix = unix - ?", (30 * amazon.SECONDS_PER_DAY,)
+    )
+    fetcher = BlockingFetch({"https://host/ok": 11})
+    window = make_window(fetcher)
+    last_id = db.get_last_id()
+    # the first scrapes were started by the window and are still running
+    assert not window.scrape_job.done()
+    window.refresh_due_products()  # returns instead of waiting
+    fetcher.release.set()
+    window.scrape_job.result(timeout=10)
+    db.flush()
+    # only the successful scrape is stored, the failed one is not a -1 row
+    assert db.get_rows_since(last_id)[0][1:4:2] == ("https://host/ok", 11.0)
+    assert len(db.get_rows_since(last_id)) == 1
+    window.refresh_due_products()  # the scheduler learns the results
+    assert window.scrape_job is None
+    assert len(window.scrape_times) == 2
+    assert window.scheduler.due(amazon.time.time()) == []
+
+
+def test_scheduler_checks_volatile_products_more_often():
+    scheduler = amazon.RefreshScheduler(48)
+    history = []
+    for hour in range(24 * 14):
+        unix = hour * 3600.0
+        history.append(("stable", unix, 10.0))
+        history.append(("volatile", unix, float(hour % 2)))
+    scheduler.learn(sorted(history))
+    assert scheduler.interval("volatile") < scheduler.interval("stable")
+    now = history[-1][1] + scheduler.interval("volatile")
+    assert scheduler.due(now) == ["volatile"]
+    later = history[-1][1] + scheduler.interval("stable")
+    assert scheduler.due(later) == ["volatile", "stable"]  # most overdue 1st
+    assert scheduler.due(later, 1) == ["volatile"]
+
+
+def test_scheduler_spends_no_budget_without_due_products():
+    scheduler = amazon.RefreshScheduler(24)
+    scheduler.add("url", 1000.0)
+    assert scheduler.due(1000.0) == []
+    scheduler.remove("url")
+    assert scheduler.due(10**10) == []
+
+
+def test_simulator_catches_more_changes_with_volatility_policy():
+    history = {}
+    for product in range(10):
+        times, prices = [], []
+        for hour in range(24 * 14):
+            times.append(hour * 3600.0)
+            volatile = product == 0
+            prices.append(float(hour % 2 if volatile else hour // 100))
+        history[f"url{product}"] = (times, prices)
+    results = {
+        adaptive: amazon.simulate_refresh_policy(history, 24, adaptive, 900)
+        for adaptive in (False, True)
+    }
+    for result in results.values():
+        assert result["scrapes"] <= 24 * 14 + 24
+        assert result["changes"] == 335 + 9 * 3
+    assert results[True]["caught"] > results[False]["caught"]